@@ -0,0 +1,22 @@
+#!/usr/bin/env python3
+"""
+shared configuration loaded from config.json.
+"""
+
+import json
+import sys
+from functools import lru_cache
+from pathlib import Path
+
+# load configuration
+@lru_cache(maxsize=1)
+def load_config():
+    """load configuration from config.json file."""
+    config_path = Path(__file__).parent / 'config.json'
+    if not config_path.exists():
+        print("error: config.json not found. copy config_EXAMPLE.json to config.json and update it.")
+        sys.exit(1)
+    with open(config_path, 'r') as f:
+        return json.load(f)
+
+CONFIG = load_config()
@@ -7,15 +7,10 @@ echo "generating are.na idea cards"
 echo "================================"
 echo ""
 
-# step 1: download and process are.na data
-echo "step 1: downloading and processing are.na data..."
-python3 process_arena_data.py
-
-echo ""
-
-# step 2: generate typst layout
-echo "step 2: generating typst layout..."
-python3 generate_typst.py
+# steps 1 and 2: download and process are.na data, then generate typst layout
+# (run in one process so processed blocks are passed along without re-reading json)
+echo "steps 1-2: downloading and processing are.na data, generating typst layout..."
+python3 main.py
 
 echo ""
 
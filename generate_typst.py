@@ -3,111 +3,112 @@
 generate typst cards layout from processed are.na blocks.
 """
 
+import io
 import json
+import os
+import re
 import sys
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
 from pathlib import Path
 
+from config import CONFIG
+
 try:
-    import qrcode
+    import segno
     HAS_QRCODE = True
 except ImportError:
     HAS_QRCODE = False
-    print("warning: couldn't see qrcode[pil] installed. qr codes will be skipped.")
-
-
-# load configuration
-def load_config():
-    """load configuration from config.json file."""
-    config_path = Path(__file__).parent / 'config.json'
-    if not config_path.exists():
-        print("error: config.json not found. copy config_EXAMPLE.json to config.json and update it.")
-        sys.exit(1)
-    with open(config_path, 'r') as f:
-        return json.load(f)
-
-CONFIG = load_config()
-
-def generate_qr_code(block_id, output_dir):
-    """generate a qr code for the are.na block url."""
-    if not HAS_QRCODE:
-        return None
+    print("warning: couldn't see segno installed. qr codes will be skipped.")
 
+def generate_qr_code(block_id):
+    """generate a qr code png for the are.na block url, returning (block_id, png bytes)."""
     url = f"https://www.are.na/block/{block_id}"
 
-    # create qr code
-    qr = qrcode.QRCode(
-        version=1,  # small size
-        error_correction=qrcode.constants.ERROR_CORRECT_L,
-        box_size=2,
-        border=1,
-    )
-    qr.add_data(url)
-    qr.make(fit=True)
+    # create qr code (smallest version that fits the url)
+    qr = segno.make(url, error='L', micro=False)
 
-    # generate image
-    img = qr.make_image(fill_color="black", back_color="white")
+    # tiny 1-bit images, so trade a few bytes for much faster zlib
+    buffer = io.BytesIO()
+    qr.save(buffer, kind='png', scale=2, border=1, compresslevel=1)
 
-    # save to qrcodes directory
-    qr_dir = Path(output_dir) / "qrcodes"
-    qr_dir.mkdir(exist_ok=True)
+    return block_id, buffer.getvalue()
 
-    qr_path = qr_dir / f"{block_id}.png"
-    img.save(qr_path)
+def generate_qr_codes(block_ids, output_dir):
+    """generate qr codes for blocks, returning a block_id -> relative path mapping."""
+    if not HAS_QRCODE:
+        return {}
 
-    return f"qrcodes/{block_id}.png"
+    qr_dir = Path(output_dir) / "qrcodes"
 
+    # block urls only depend on the block id, so reuse qr codes from a previous run
+    missing = []
+    for block_id in block_ids:
+        qr_path = qr_dir / f"{block_id}.png"
+        if not (qr_path.exists() and qr_path.stat().st_size > 0):
+            missing.append(block_id)
+
+    if missing:
+        # encoding is cpu-bound and independent per block, so run it in worker processes
+        # and keep all disk writes in this process
+        qr_dir.mkdir(exist_ok=True)
+        with ProcessPoolExecutor() as executor:
+            for block_id, png_data in executor.map(generate_qr_code, missing, chunksize=8):
+                # write then rename so a partial file is never picked up as cached
+                partial_path = qr_dir / f"{block_id}.png.part"
+                partial_path.write_bytes(png_data)
+                os.replace(partial_path, qr_dir / f"{block_id}.png")
+
+    return {block_id: f"qrcodes/{block_id}.png" for block_id in block_ids}
+
+# backslashes, quotes and hashes (for typst markup) are escaped in a single pass
+_ESCAPE_TABLE = str.maketrans({'\\': '\\\\', '"': '\\"', '#': '\\#'})
+
+# channel names and titles repeat across cards, so memoize escapes
+@lru_cache(maxsize=1024)
 def escape_typst_string(text):
     """escape special characters for typst strings."""
-    if not text:
-        return ""
-    # escape backslashes first
-    text = text.replace('\\', '\\\\')
-    # escape quotes
-    text = text.replace('"', '\\"')
-    # escape hash (for typst markup)
-    text = text.replace('#', '\\#')
-    return text
+    return text.translate(_ESCAPE_TABLE) if text else ""
+
+# classifies a stripped, already escaped markdown line by its heading or list marker
+# (heading hashes appear as \# after escaping)
+_LINE_RE = re.compile(r'((?:\\#){1,3} |[-*] )?(.*)')
+
+# escaped markdown heading marker -> typst heading helper defined in the document header
+_HEADING_HELPERS = {'\\# ': 'h1', '\\#\\# ': 'h2', '\\#\\#\\# ': 'h3'}
 
 def format_content_as_typst(content):
     """convert markdown content to typst markup."""
     if not content:
         return ""
 
-    lines = content.split('\n')
+    # escape the whole content in one pass (bypassing the escape cache, which is for
+    # short repeated strings), then work line by line
+    # note: headings are escaped too even though they go inside [...] because
+    # special chars like # still need escaping in typst content blocks
+    lines = content.translate(_ESCAPE_TABLE).split('\n')
     formatted_lines = []
 
-    for i, line in enumerate(lines):
+    for line, next_line in zip(lines, lines[1:] + ['']):
         stripped = line.strip()
+        marker, text = _LINE_RE.match(stripped).groups()
 
-        # convert markdown headings to typst text formatting
-        if stripped.startswith('# '):
-            # remove the # and make it bold/larger (13pt)
-            text = stripped[2:]  # remove "# "
-            # note: we escape text here even though it goes inside [...] because
-            # special chars like # still need escaping in typst content blocks
-            formatted_lines.append(f'      #text(weight: "bold", size: 13pt)[{escape_typst_string(text)}]')
-        elif stripped.startswith('## '):
-            # 12pt
-            text = stripped[3:]  # remove "## "
-            formatted_lines.append(f'      #text(weight: "bold", size: 12pt)[{escape_typst_string(text)}]')
-        elif stripped.startswith('### '):
-            # 11pt
-            text = stripped[4:]  # remove "### "
-            formatted_lines.append(f'      #text(weight: "bold", size: 11pt)[{escape_typst_string(text)}]')
+        # convert markdown headings to bold typst text (13pt, 12pt, 11pt)
+        if marker in _HEADING_HELPERS:
+            formatted_lines.append(f'      #{_HEADING_HELPERS[marker]}[{text}]')
         elif stripped == '':
             # preserve empty lines as paragraph breaks
             formatted_lines.append('')
-        elif stripped.startswith('- ') or stripped.startswith('* '):
+        elif marker:
             # list items - don't add linebreak after (typst handles list spacing)
-            formatted_lines.append('      ' + escape_typst_string(line))
+            formatted_lines.append('      ' + line)
         else:
             # regular text - add linebreak after each line to preserve newlines
-            formatted_lines.append('      ' + escape_typst_string(line))
+            formatted_lines.append('      ' + line)
             # don't add linebreak if next line is a list item or empty
-            if i + 1 < len(lines):
-                next_stripped = lines[i + 1].strip()
-                if not next_stripped.startswith('-') and not next_stripped.startswith('*') and next_stripped != '':
-                    formatted_lines.append('      #linebreak()')
+            next_stripped = next_line.strip()
+            if next_stripped and next_stripped[0] not in '-*':
+                formatted_lines.append('      #linebreak()')
 
     # remove trailing linebreak if present
     if formatted_lines and formatted_lines[-1] == '      #linebreak()':
@@ -115,35 +116,31 @@ def format_content_as_typst(content):
 
     return '\n'.join(formatted_lines)
 
-def generate_card(block, images_dir, output_dir):
+def generate_card(block, images_subdir, qr_paths):
     """generate typst code for a single card."""
-    card_parts = []
-
     block_id = block.get('id')
 
+    # each optional field is rendered as a complete line, or left empty
+
     # title
     title = block.get('title')
-    if title:
-        card_parts.append(f'    title: "{escape_typst_string(title)}",')
+    title_line = f'    title: "{escape_typst_string(title)}",\n' if title else ''
 
     # image or content
     image_file = block.get('image_file')
     content = block.get('content')
 
+    body_line = ''
     if image_file:
         # use relative path from typst file to images
-        # images_dir is a Path object, get just the directory name
-        images_subdir = Path(images_dir).name
-        image_path = f"{images_subdir}/{image_file}"
-        card_parts.append(f'    img-path: "{image_path}",')
+        body_line = f'    img-path: "{images_subdir}/{image_file}",\n'
     elif content:
         # format content as typst markup
-        typst_content = format_content_as_typst(content)
-        # use raw strings for content blocks
-        card_parts.append(f'    content: [\n{typst_content}\n    ],')
+        body_line = f'    content: [\n{format_content_as_typst(content)}\n    ],\n'
 
     # source url
     source_url = block.get('source_url')
+    url_lines = ''
     if source_url:
         # truncate long urls for display
         max_url_length = 80
@@ -152,39 +149,32 @@ def generate_card(block, images_dir, output_dir):
         else:
             display_url = source_url
 
-        card_parts.append(f'    source-url: "{escape_typst_string(source_url)}",')
-        card_parts.append(f'    source-url-display: "{escape_typst_string(display_url)}",')
+        url_lines = (
+            f'    source-url: "{escape_typst_string(source_url)}",\n'
+            f'    source-url-display: "{escape_typst_string(display_url)}",\n'
+        )
 
     # channels (always present)
     channels = block.get('channels', [])
-    channels_str = ', '.join([f'"{escape_typst_string(c)}"' for c in channels])
+    esc = escape_typst_string
+    channels_str = ', '.join([f'"{esc(c)}"' for c in channels])
     # add trailing comma for single element to ensure it's a tuple in typst
     if len(channels) == 1:
-        card_parts.append(f'    channels: ({channels_str},),')
-    else:
-        card_parts.append(f'    channels: ({channels_str}),')
+        channels_str += ','
 
-    # generate qr code
-    if HAS_QRCODE and block_id:
-        qr_path = generate_qr_code(block_id, output_dir)
-        if qr_path:
-            card_parts.append(f'    qr-code: "{qr_path}",')
+    # qr code (generated up front in generate_typst_file)
+    qr_path = qr_paths.get(block_id) if block_id else None
+    qr_line = f'    qr-code: "{qr_path}",\n' if qr_path else ''
 
-    # build the card
-    card_code = "  card(\n" + '\n'.join(card_parts) + "\n  )"
-    return card_code
+    return f'  card(\n{title_line}{body_line}{url_lines}    channels: ({channels_str}),\n{qr_line}  )'
 
-def generate_typst_file(blocks_file, images_dir, output_file):
-    """generate complete typst file from blocks data."""
-
-    # load blocks
-    with open(blocks_file, 'r') as f:
-        blocks = json.load(f)
+def generate_typst_file(blocks, images_dir, output_file):
+    """generate complete typst file from a list of processed blocks."""
 
     print(f"generating typst layout for {len(blocks)} blocks...")
 
     # generate typst header
-    typst_code = '''// generated cards from are.na data
+    typst_header = '''// generated cards from are.na data
 
 #set page(
   width: 8.5in,
@@ -202,6 +192,11 @@ def generate_typst_file(blocks_file, images_dir, output_file):
 #let card-height = 4.5in
 #let card-gap = 0.25in
 
+// headings in text content
+#let h1(body) = text(weight: "bold", size: 13pt, body)
+#let h2(body) = text(weight: "bold", size: 12pt, body)
+#let h3(body) = text(weight: "bold", size: 11pt, body)
+
 // card component
 #let card(
   title: none,
@@ -282,32 +277,43 @@ def generate_typst_file(blocks_file, images_dir, output_file):
     output_path = Path(output_file)
     output_path.parent.mkdir(parents=True, exist_ok=True)
 
+    # generate qr codes for all blocks up front
+    block_ids = [b['id'] for b in blocks if b.get('id')]
+    qr_paths = generate_qr_codes(block_ids, output_path.parent)
+
+    # images are referenced relative to the typst file, by directory name only
+    images_subdir = Path(images_dir).name
+
     # generate cards in groups of 4 (2x2 grid per page)
+    # each page is streamed to the file instead of building the whole document in memory
     cards_per_page = 4
-    for i in range(0, len(blocks), cards_per_page):
-        page_blocks = blocks[i:i + cards_per_page]
+    with open(output_path, 'w') as f:
+        f.write(typst_header)
 
-        # generate grid for this page
-        typst_code += "\n#grid(\n"
-        typst_code += "  columns: 2,\n"
-        typst_code += "  rows: 2,\n"
-        typst_code += "  column-gutter: card-gap,\n"
-        typst_code += "  row-gutter: card-gap,\n"
-        typst_code += "  \n"
+        for i in range(0, len(blocks), cards_per_page):
+            page_blocks = blocks[i:i + cards_per_page]
 
-        # generate each card
-        card_codes = [generate_card(block, images_dir, output_path.parent) for block in page_blocks]
-        typst_code += ",\n".join(card_codes)
+            # generate grid for this page
+            f.write(
+                "\n#grid(\n"
+                "  columns: 2,\n"
+                "  rows: 2,\n"
+                "  column-gutter: card-gap,\n"
+                "  row-gutter: card-gap,\n"
+                "  \n"
+            )
 
-        typst_code += "\n)\n"
+            # generate each card
+            for j, block in enumerate(page_blocks):
+                if j:
+                    f.write(",\n")
+                f.write(generate_card(block, images_subdir, qr_paths))
 
-        # add page break if not last page
-        if i + cards_per_page < len(blocks):
-            typst_code += "\n#pagebreak()\n"
+            f.write("\n)\n")
 
-    # write to file
-    with open(output_path, 'w') as f:
-        f.write(typst_code)
+            # add page break if not last page
+            if i + cards_per_page < len(blocks):
+                f.write("\n#pagebreak()\n")
 
     print(f"generated typst file: {output_path}")
     print(f"  total cards: {len(blocks)}")
@@ -325,4 +331,8 @@ if __name__ == "__main__":
         print(f"error: {blocks_file} not found. run process_arena_data.py first.")
         sys.exit(1)
 
-    generate_typst_file(str(blocks_file), str(images_dir), str(output_file))
\ No newline at end of file
+    # load blocks
+    with open(blocks_file, 'r') as f:
+        blocks = json.load(f)
+
+    generate_typst_file(blocks, str(images_dir), str(output_file))
\ No newline at end of file
@@ -0,0 +1,41 @@
+#!/usr/bin/env python3
+"""
+run the whole pipeline in one process: download and process are.na data, then generate the typst layout.
+"""
+
+import sys
+from pathlib import Path
+
+from config import CONFIG
+from process_arena_data import download_arena_data, process_arena_data
+from generate_typst import generate_typst_file
+
+def run_pipeline():
+    """download, process and lay out blocks, passing data between steps in memory."""
+    # get api token from config
+    token = CONFIG.get('arena_personal_token')
+    if not token:
+        print("error: arena_personal_token not set in config.json")
+        sys.exit(1)
+
+    # setup paths
+    output_dir = Path(CONFIG['output_dir'])
+    output_dir.mkdir(exist_ok=True)
+
+    raw_data_path = output_dir / CONFIG['raw_data_filename']
+    images_dir = output_dir / CONFIG['images_dir']
+    output_file = output_dir / CONFIG['output_typst_file']
+
+    # download data from are.na api
+    data = download_arena_data(CONFIG['arena_user_slug'], token, raw_data_path)
+
+    # process data and download images
+    min_updated_date = CONFIG.get('min_updated_date')
+    blocks = process_arena_data(data, output_dir, CONFIG['images_dir'], min_updated_date)
+
+    # generate typst layout straight from the processed blocks
+    print()
+    return generate_typst_file(blocks, str(images_dir), str(output_file))
+
+if __name__ == "__main__":
+    run_pipeline()
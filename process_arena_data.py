@@ -5,38 +5,176 @@ download and process are.na data: deduplicate blocks, download images, create js
 
 import json
 import os
+import shutil
 import sys
 from pathlib import Path
-from urllib.parse import urlparse
+from urllib.parse import urlparse, urljoin, urlsplit
+import urllib.error
 import urllib.request
+import http.client
+import threading
 import html
 from datetime import datetime
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from config import CONFIG
+
+# number of concurrent requests to the are.na api
+FETCH_WORKERS = 16
+
+# number of concurrent image downloads
+IMAGE_WORKERS = 8
+
+# python 3.11+ parses the trailing 'Z' of are.na timestamps natively
+if sys.version_info >= (3, 11):
+    _fromisoformat = datetime.fromisoformat
+else:
+    def _fromisoformat(timestamp):
+        return datetime.fromisoformat(timestamp.replace('Z', '+00:00'))
+
+@lru_cache(maxsize=4096)
+def parse_timestamp(timestamp):
+    """parse an iso 8601 timestamp, cached since blocks often share timestamps."""
+    return _fromisoformat(timestamp)
+
+# keep-alive connections, one per host for each worker thread
+_connections = threading.local()
+
+def get_connection(scheme, host):
+    """return this thread's reusable connection to host, creating it if needed."""
+    pool = getattr(_connections, 'pool', None)
+    if pool is None:
+        pool = _connections.pool = {}
+    conn = pool.get((scheme, host))
+    if conn is None:
+        connection_class = http.client.HTTPSConnection if scheme == 'https' else http.client.HTTPConnection
+        conn = pool[(scheme, host)] = connection_class(host, timeout=30)
+    return conn
+
+def uses_proxy(scheme, host):
+    """whether the environment's proxy settings (*_proxy / no_proxy) apply to host."""
+    return scheme in urllib.request.getproxies() and not urllib.request.proxy_bypass(host)
+
+def open_url(url, headers, max_redirects=5):
+    """send a GET request over a pooled keep-alive connection, following redirects.
+
+    the response must be read completely before the same thread opens another url.
+    raises urllib.error.HTTPError for error statuses, like urlopen does.
+    urls that go through a proxy are opened with urlopen instead, without pooling.
+    """
+    for _ in range(max_redirects + 1):
+        parts = urlsplit(url)
+        if uses_proxy(parts.scheme, parts.hostname or ''):
+            return urllib.request.urlopen(urllib.request.Request(url, headers=headers), timeout=30)
+
+        path = parts.path or '/'
+        if parts.query:
+            path += '?' + parts.query
+
+        conn = get_connection(parts.scheme, parts.netloc)
+        try:
+            conn.request('GET', path, headers=headers)
+            response = conn.getresponse()
+        except (http.client.HTTPException, ConnectionError):
+            # the server may have dropped an idle connection, retry once on a fresh one
+            conn.close()
+            conn.request('GET', path, headers=headers)
+            response = conn.getresponse()
+
+        location = response.getheader('Location')
+        if response.status in (301, 302, 303, 307, 308) and location:
+            response.read()
+            url = urljoin(url, location)
+            continue
 
-# load configuration
-def load_config():
-    """load configuration from config.json file."""
-    config_path = Path(__file__).parent / 'config.json'
-    if not config_path.exists():
-        print("error: config.json not found. copy config_EXAMPLE.json to config.json and update it.")
-        sys.exit(1)
-    with open(config_path, 'r') as f:
-        return json.load(f)
+        if response.status >= 300:
+            # errors, and redirects without a location, fail like urlopen
+            # drain the body so the connection can be reused
+            response.read()
+            raise urllib.error.HTTPError(url, response.status, response.reason, response.headers, None)
+
+        return response
+
+    raise urllib.error.URLError(f"too many redirects for {url}")
 
-CONFIG = load_config()
+def fetch_json(url, token):
+    """fetch a url from the are.na api and return the parsed json."""
+    response = open_url(url, {'Authorization': f'Bearer {token}'})
+    return json.loads(response.read().decode())
+
+def fetch_block(block_id, token):
+    """fetch a single block from the are.na blocks api."""
+    return fetch_json(f"https://api.are.na/v2/blocks/{block_id}", token)
+
+def add_block_channels(block_to_channels, blocks_by_id, contents, channel_title):
+    """record channel membership and the block payload for each block in a page of channel contents."""
+    for block in contents:
+        block_id = block.get('id')
+        if block_id:
+            if block_id not in block_to_channels:
+                block_to_channels[block_id] = []
+            if channel_title not in block_to_channels[block_id]:
+                block_to_channels[block_id].append(channel_title)
+
+            # keep the most recently updated payload, and the latest connection date
+            # across all channels the block is in
+            existing = blocks_by_id.get(block_id)
+            if existing is None:
+                blocks_by_id[block_id] = block
+                continue
+            connected_at = max(existing.get('connected_at') or '', block.get('connected_at') or '') or None
+            if (block.get('updated_at') or '') > (existing.get('updated_at') or ''):
+                blocks_by_id[block_id] = existing = block
+            existing['connected_at'] = connected_at
+
+def merge_channel_fields(channel_block, block_data, channel_titles):
+    """combine block data with the channel-level fields from channel contents.
+
+    block_data wins for block fields, anything it leaves out comes from channel_block,
+    and connection date and channel membership always come from the current channels.
+    """
+    return {
+        **channel_block,
+        **block_data,
+        'connected_at': channel_block.get('connected_at'),
+        'channel_titles': channel_titles,
+    }
+
+# fields process_arena_data reads from each block
+REQUIRED_BLOCK_FIELDS = ('id', 'title', 'updated_at', 'user', 'source', 'image', 'content')
+
+def needs_block_fetch(block):
+    """whether a block from channel contents has to be fetched from the blocks api."""
+    # text contents in channel listings can lag behind the blocks api
+    if block.get('class') == 'Text':
+        return True
+    return any(field not in block for field in REQUIRED_BLOCK_FIELDS)
+
+def load_previous_blocks(output_path):
+    """load blocks from a previous run's raw data, keyed by block id."""
+    if not Path(output_path).exists():
+        return {}
+
+    try:
+        with open(output_path, 'r') as f:
+            return {block['id']: block for block in json.load(f).get('blocks', [])}
+    except Exception as e:
+        print(f"warning: couldn't read previous data from {output_path}: {e}")
+        return {}
 
 def download_arena_data(user_slug, token, output_path):
     """download user's channels data from are.na api."""
 
+    # blocks from the last run can be reused if they haven't been updated since
+    previous_blocks = load_previous_blocks(output_path)
+
     # first, get the list of channels
     channels_url = f"https://api.are.na/v2/users/{user_slug}/channels"
     print(f"downloading channel list for user: {user_slug}")
 
-    req = urllib.request.Request(channels_url)
-    req.add_header('Authorization', f'Bearer {token}')
-
     try:
-        with urllib.request.urlopen(req) as response:
-            channels_data = json.loads(response.read().decode())
+        channels_data = fetch_json(channels_url, token)
     except Exception as e:
         print(f"error downloading channel list: {e}")
         sys.exit(1)
@@ -44,25 +182,31 @@ def download_arena_data(user_slug, token, output_path):
     # fetch each channel to get block IDs and build block->channels mapping
     print(f"fetching block IDs from {len(channels_data.get('channels', []))} channels...")
     block_to_channels = {}  # maps block_id -> list of channel titles
+    blocks_by_id = {}  # maps block_id -> block payload from channel contents
 
-    for i, channel in enumerate(channels_data.get('channels', []), 1):
-        channel_slug = channel.get('slug')
-        channel_title = channel.get('title', 'Untitled')
-
-        if not channel_slug:
-            continue
-
-        print(f"  [{i}/{len(channels_data['channels'])}] {channel_title}")
-
-        # fetch channel data to get block IDs
+    # requests are network-bound, so overlap them with a thread pool
+    with ThreadPoolExecutor(max_workers=FETCH_WORKERS) as executor:
+        # request the first page of every channel up front
         # use per=100 to get up to 100 blocks per page (API default is 20)
-        channel_url = f"https://api.are.na/v2/channels/{channel_slug}?per=100"
-        req = urllib.request.Request(channel_url)
-        req.add_header('Authorization', f'Bearer {token}')
+        first_pages = {}
+        for channel in channels_data.get('channels', []):
+            channel_slug = channel.get('slug')
+            if channel_slug:
+                channel_url = f"https://api.are.na/v2/channels/{channel_slug}?per=100"
+                first_pages[channel_slug] = executor.submit(fetch_json, channel_url, token)
+
+        for i, channel in enumerate(channels_data.get('channels', []), 1):
+            channel_slug = channel.get('slug')
+            channel_title = channel.get('title', 'Untitled')
+
+            if not channel_slug:
+                continue
 
-        try:
-            with urllib.request.urlopen(req) as response:
-                channel_data = json.loads(response.read().decode())
+            print(f"  [{i}/{len(channels_data['channels'])}] {channel_title}")
+
+            try:
+                # fetch channel data to get block IDs
+                channel_data = first_pages[channel_slug].result()
 
                 # check if we need more pages
                 total_blocks = channel_data.get('length', 0)
@@ -70,70 +214,76 @@ def download_arena_data(user_slug, token, output_path):
                 blocks_received = len(contents)
 
                 # collect block IDs from first page
-                for block in contents:
-                    block_id = block.get('id')
-                    if block_id:
-                        if block_id not in block_to_channels:
-                            block_to_channels[block_id] = []
-                        if channel_title not in block_to_channels[block_id]:
-                            block_to_channels[block_id].append(channel_title)
-
-                # fetch remaining pages if needed
+                add_block_channels(block_to_channels, blocks_by_id, contents, channel_title)
+
+                # fetch remaining pages concurrently if needed
                 if blocks_received < total_blocks:
                     print(f"    note: fetching additional pages ({blocks_received}/{total_blocks} blocks)")
 
-                    page = 2
-                    while blocks_received < total_blocks:
-                        page_url = f"https://api.are.na/v2/channels/{channel_slug}?per=100&page={page}"
-                        req = urllib.request.Request(page_url)
-                        req.add_header('Authorization', f'Bearer {token}')
-
-                        with urllib.request.urlopen(req) as page_response:
-                            page_data = json.loads(page_response.read().decode())
-                            page_contents = page_data.get('contents', [])
-
-                            if not page_contents:
-                                break
-
-                            # collect block IDs from this page
-                            for block in page_contents:
-                                block_id = block.get('id')
-                                if block_id:
-                                    if block_id not in block_to_channels:
-                                        block_to_channels[block_id] = []
-                                    if channel_title not in block_to_channels[block_id]:
-                                        block_to_channels[block_id].append(channel_title)
-
-                            blocks_received += len(page_contents)
-                            print(f"    page {page}: +{len(page_contents)} blocks ({blocks_received}/{total_blocks})")
-                            page += 1
-
-        except Exception as e:
-            print(f"    warning: failed to download {channel_title}: {e}")
-            continue
+                    page_count = (total_blocks + 99) // 100
+                    page_urls = [
+                        f"https://api.are.na/v2/channels/{channel_slug}?per=100&page={page}"
+                        for page in range(2, page_count + 1)
+                    ]
+                    # map keeps results in page order
+                    for page, page_data in enumerate(executor.map(fetch_json, page_urls, [token] * len(page_urls)), 2):
+                        page_contents = page_data.get('contents', [])
+                        if not page_contents:
+                            break
+
+                        # collect block IDs from this page
+                        add_block_channels(block_to_channels, blocks_by_id, page_contents, channel_title)
+
+                        blocks_received += len(page_contents)
+                        print(f"    page {page}: +{len(page_contents)} blocks ({blocks_received}/{total_blocks})")
+
+            except Exception as e:
+                print(f"    warning: failed to download {channel_title}: {e}")
+                continue
 
-    # now fetch each unique block individually
-    unique_block_ids = list(block_to_channels.keys())
-    print(f"\nfetching {len(unique_block_ids)} unique blocks from blocks API...")
+        # most blocks can use the payload already returned in channel contents.
+        # the rest are reused from the last run if unchanged, or fetched individually
+        unique_block_ids = list(block_to_channels.keys())
+        fetched = {}
+        to_fetch = []
+        reused_count = 0
+        for block_id in unique_block_ids:
+            block = blocks_by_id[block_id]
+            block['channel_titles'] = block_to_channels[block_id]
+            if not needs_block_fetch(block):
+                fetched[block_id] = block
+                continue
 
-    blocks = []
-    for i, block_id in enumerate(unique_block_ids, 1):
-        if i % 10 == 0 or i == len(unique_block_ids):
-            print(f"  [{i}/{len(unique_block_ids)}] fetching block {block_id}")
+            previous = previous_blocks.get(block_id)
+            updated_at = block.get('updated_at')
+            if previous and updated_at and previous.get('updated_at') == updated_at:
+                # channel membership and connections may have changed even if the block hasn't
+                fetched[block_id] = merge_channel_fields(block, previous, block_to_channels[block_id])
+                reused_count += 1
+            else:
+                to_fetch.append(block_id)
+
+        print(f"\nusing channel data for {len(fetched) - reused_count} blocks")
+        if reused_count:
+            print(f"reusing {reused_count} unchanged blocks from {output_path}")
+        print(f"fetching {len(to_fetch)} new or updated blocks from blocks API...")
+
+        futures = {executor.submit(fetch_block, block_id, token): block_id for block_id in to_fetch}
+        for i, future in enumerate(as_completed(futures), 1):
+            block_id = futures[future]
+            if i % 10 == 0 or i == len(to_fetch):
+                print(f"  [{i}/{len(to_fetch)}] fetched block {block_id}")
+
+            try:
+                block_data = future.result()
+            except Exception as e:
+                print(f"    warning: failed to fetch block {block_id}: {e}")
+                continue
 
-        block_url = f"https://api.are.na/v2/blocks/{block_id}"
-        req = urllib.request.Request(block_url)
-        req.add_header('Authorization', f'Bearer {token}')
+            fetched[block_id] = merge_channel_fields(blocks_by_id[block_id], block_data, block_to_channels[block_id])
 
-        try:
-            with urllib.request.urlopen(req) as response:
-                block_data = json.loads(response.read().decode())
-                # add channel membership to block data
-                block_data['channel_titles'] = block_to_channels[block_id]
-                blocks.append(block_data)
-        except Exception as e:
-            print(f"    warning: failed to fetch block {block_id}: {e}")
-            continue
+    # keep blocks in channel order regardless of completion order
+    blocks = [fetched[block_id] for block_id in unique_block_ids if block_id in fetched]
 
     # save raw data in new format
     data = {'blocks': blocks}
@@ -143,6 +293,14 @@ def download_arena_data(user_slug, token, output_path):
     print(f"downloaded data saved to: {output_path}")
     return data
 
+# magic-byte prefixes used to detect the real type of downloaded images
+_MAGIC = (
+    (b'\x89PNG\r\n\x1a\n', '.png'),
+    (b'\xff\xd8\xff', '.jpg'),
+    (b'GIF87a', '.gif'),
+    (b'GIF89a', '.gif'),
+)
+
 def download_image(url, output_dir, block_id, filename):
     """download an image from url to output directory."""
     # create safe filename using block_id and original filename
@@ -158,13 +316,10 @@ def download_image(url, output_dir, block_id, filename):
     try:
         print(f"  downloading: {safe_filename} from {url}")
 
-        # use urlopen for better control and error handling
-        req = urllib.request.Request(url)
-        req.add_header('User-Agent', 'Mozilla/5.0')  # some servers require this
-
-        with urllib.request.urlopen(req, timeout=30) as response:
-            # read the data
-            data = response.read()
+        # some servers require a user agent
+        with open_url(url, {'User-Agent': 'Mozilla/5.0'}) as response:
+            # read just enough to detect the file type, the rest is streamed to disk
+            data = response.read(16)
 
             # check if we got data
             if not data:
@@ -172,14 +327,9 @@ def download_image(url, output_dir, block_id, filename):
                 return None
 
             # detect actual file type from magic bytes and correct extension if needed
-            actual_ext = None
-            if data.startswith(b'\x89PNG\r\n\x1a\n'):
-                actual_ext = '.png'
-            elif data.startswith(b'\xff\xd8\xff'):
-                actual_ext = '.jpg'
-            elif data.startswith(b'GIF87a') or data.startswith(b'GIF89a'):
-                actual_ext = '.gif'
-            elif data.startswith(b'RIFF') and b'WEBP' in data[:20]:
+            actual_ext = next((magic_ext for signature, magic_ext in _MAGIC if data.startswith(signature)), None)
+            # webp is a riff container with the format tag at a fixed offset
+            if actual_ext is None and data[:4] == b'RIFF' and data[8:12] == b'WEBP':
                 actual_ext = '.webp'
 
             # if detected type differs from filename extension, use correct one
@@ -188,29 +338,30 @@ def download_image(url, output_dir, block_id, filename):
                 safe_filename = f"{block_id}{actual_ext}"
                 output_path = output_dir / safe_filename
 
-            # write to file
-            with open(output_path, 'wb') as f:
-                f.write(data)
+            # stream to a partial file so an interrupted download is never mistaken for a complete one
+            partial_path = output_path.with_name(output_path.name + '.part')
+            try:
+                with open(partial_path, 'wb') as f:
+                    f.write(data)
+                    shutil.copyfileobj(response, f, length=64 * 1024)
+            except BaseException:
+                partial_path.unlink(missing_ok=True)
+                raise
+            os.replace(partial_path, output_path)
 
             file_size = output_path.stat().st_size
             print(f"  downloaded {safe_filename} ({file_size} bytes)")
             return safe_filename
 
+    # partial files are removed above, so output_path is never left empty
     except urllib.error.HTTPError as e:
         print(f"  http error {e.code} downloading {safe_filename}: {e.reason}")
-        # clean up empty file if it was created
-        if output_path.exists() and output_path.stat().st_size == 0:
-            output_path.unlink()
         return None
     except urllib.error.URLError as e:
         print(f"  url error downloading {safe_filename}: {e.reason}")
-        if output_path.exists() and output_path.stat().st_size == 0:
-            output_path.unlink()
         return None
     except Exception as e:
         print(f"  error downloading {safe_filename}: {e}")
-        if output_path.exists() and output_path.stat().st_size == 0:
-            output_path.unlink()
         return None
 
 def process_arena_data(data, output_dir, images_subdir, min_updated_date=None):
@@ -220,7 +371,7 @@ def process_arena_data(data, output_dir, images_subdir, min_updated_date=None):
     min_datetime = None
     if min_updated_date:
         try:
-            min_datetime = datetime.fromisoformat(min_updated_date.replace('Z', '+00:00'))
+            min_datetime = parse_timestamp(min_updated_date)
             print(f"filtering blocks updated after: {min_updated_date}")
         except ValueError as e:
             print(f"warning: invalid min_updated_date format '{min_updated_date}': {e}")
@@ -232,6 +383,7 @@ def process_arena_data(data, output_dir, images_subdir, min_updated_date=None):
 
     # list to store processed blocks
     blocks_list = []
+    pending_images = []  # (block_data, image_url, filename) tuples
     filtered_count = 0
 
     print(f"\nprocessing {len(data.get('blocks', []))} blocks...")
@@ -256,7 +408,7 @@ def process_arena_data(data, output_dir, images_subdir, min_updated_date=None):
             updated_at_str = block.get('updated_at')
             if updated_at_str:
                 try:
-                    updated_at = datetime.fromisoformat(updated_at_str.replace('Z', '+00:00'))
+                    updated_at = parse_timestamp(updated_at_str)
                     block_date = updated_at
                 except ValueError:
                     pass
@@ -265,7 +417,7 @@ def process_arena_data(data, output_dir, images_subdir, min_updated_date=None):
             connected_at_str = block.get('connected_at')
             if connected_at_str:
                 try:
-                    connected_at = datetime.fromisoformat(connected_at_str.replace('Z', '+00:00'))
+                    connected_at = parse_timestamp(connected_at_str)
                     # use the more recent of the two dates
                     if block_date is None or connected_at > block_date:
                         block_date = connected_at
@@ -315,14 +467,8 @@ def process_arena_data(data, output_dir, images_subdir, min_updated_date=None):
 
             if image_url:
                 block_data['image_url'] = image_url
-                downloaded_filename = download_image(
-                    image_url,
-                    images_dir,
-                    block_id,
-                    filename
-                )
-                if downloaded_filename:
-                    block_data['image_file'] = downloaded_filename
+                # queue the download, images are fetched together below
+                pending_images.append((block_data, image_url, filename))
 
         # handle text content (for text blocks)
         content = block.get('content')
@@ -332,6 +478,19 @@ def process_arena_data(data, output_dir, images_subdir, min_updated_date=None):
 
         blocks_list.append(block_data)
 
+    # download queued images concurrently
+    if pending_images:
+        print(f"\ndownloading {len(pending_images)} images...")
+        with ThreadPoolExecutor(max_workers=IMAGE_WORKERS) as executor:
+            futures = {
+                executor.submit(download_image, image_url, images_dir, block_data['id'], filename): block_data
+                for block_data, image_url, filename in pending_images
+            }
+            for future in as_completed(futures):
+                downloaded_filename = future.result()
+                if downloaded_filename:
+                    futures[future]['image_file'] = downloaded_filename
+
     # save processed data
     output_file = Path(output_dir) / CONFIG['processed_data_filename']
     with open(output_file, 'w') as f: